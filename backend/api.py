@@ -1,15 +1,22 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from pydantic import BaseModel, HttpUrl
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, ORJSONResponse
+from pydantic import BaseModel, HttpUrl, TypeAdapter
 from typing import List, Dict, Any, Optional
 import os
 import json
 
 from .manager import DownloadManager
-from .config import ConfigManager
+from .serialization import dumps
 
-app = FastAPI(title="Download Manager API")
+class JSONResponse(ORJSONResponse):
+    """ORJSONResponse that also knows how to encode URLs and paths"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+app = FastAPI(title="Download Manager API", default_response_class=JSONResponse)
 
 # Enable CORS
 app.add_middleware(
@@ -22,19 +29,41 @@ app.add_middleware(
 
 # Initialize managers
 download_manager = DownloadManager()
-config_manager = ConfigManager()
+config_manager = download_manager.config_manager
 
 # Pydantic models
 class DownloadRequest(BaseModel):
     url: HttpUrl
 
 class BatchDownloadRequest(BaseModel):
-    urls: List[HttpUrl]
+    urls: List[str]
+
+# Validates a whole URL list in one call instead of per-field
+URL_LIST = TypeAdapter(List[HttpUrl])
 
 class ConfigUpdate(BaseModel):
     config: Optional[Dict[str, Any]] = None
     settings: Optional[Dict[str, Any]] = None
 
+def _task_to_dict(task) -> Dict[str, Any]:
+    """Convert a DownloadTask to the plain dict returned by the API"""
+    payload = {
+        "id": task.id,
+        "url": task.url,
+        "filename": task.filename,
+        "filepath": task.filepath,
+        "total_size": task.total_size,
+        "downloaded_size": task.downloaded_size,
+        "status": task.status,
+        "speed": task.speed,
+        "progress": task.progress,
+        "eta": task.eta
+    }
+    # Like exclude_none: only send the error when there is one
+    if task.error is not None:
+        payload["error"] = task.error
+    return payload
+
 @app.on_event("startup")
 async def startup_event():
     """Start download manager on API startup"""
@@ -58,8 +87,10 @@ async def add_download(request: DownloadRequest):
 async def add_batch_downloads(request: BatchDownloadRequest):
     """Add multiple downloads"""
     try:
-        urls = [str(url) for url in request.urls]
-        task_ids = download_manager.add_downloads_batch(urls)
+        urls = [str(url) for url in URL_LIST.validate_python(request.urls)]
+        
+        # Probing blocks on the network, keep it off the event loop
+        task_ids = await run_in_threadpool(download_manager.add_downloads_batch, urls)
         return {"task_ids": task_ids, "message": f"Added {len(task_ids)} downloads"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -72,23 +103,8 @@ async def get_all_downloads():
         # Convert DownloadTask objects to dictionaries
         result = {}
         for status, tasks in downloads.items():
-            result[status] = [
-                {
-                    "id": task.id,
-                    "url": task.url,
-                    "filename": task.filename,
-                    "filepath": task.filepath,
-                    "total_size": task.total_size,
-                    "downloaded_size": task.downloaded_size,
-                    "status": task.status,
-                    "speed": task.speed,
-                    "progress": task.progress,
-                    "error": task.error,
-                    "eta": task.eta
-                }
-                for task in tasks
-            ]
-        return result
+            result[status] = [_task_to_dict(task) for task in tasks]
+        return JSONResponse(content=result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -99,19 +115,7 @@ async def get_download_status(task_id: str):
     if not task:
         raise HTTPException(status_code=404, detail="Download not found")
     
-    return {
-        "id": task.id,
-        "url": task.url,
-        "filename": task.filename,
-        "filepath": task.filepath,
-        "total_size": task.total_size,
-        "downloaded_size": task.downloaded_size,
-        "status": task.status,
-        "speed": task.speed,
-        "progress": task.progress,
-        "error": task.error,
-        "eta": task.eta
-    }
+    return JSONResponse(content=_task_to_dict(task))
 
 @app.post("/api/download/{task_id}/pause")
 async def pause_download(task_id: str):
@@ -183,11 +187,16 @@ async def update_config(update: ConfigUpdate):
 async def import_links_file(file: UploadFile = File(...)):
     """Import links from a text file"""
     try:
-        content = await file.read()
-        urls = content.decode('utf-8').strip().split('')
-        urls = [url.strip() for url in urls if url.strip() and not url.startswith('#')]
+        # Read the spooled upload line by line instead of buffering it all,
+        # filtering on raw bytes so comments and blank lines are never decoded
+        urls = []
+        for raw in iter(file.file.readline, b''):
+            line = raw.strip()
+            if line and not line.startswith(b'#'):
+                urls.append(line.decode('utf-8'))
+        urls = [str(url) for url in URL_LIST.validate_python(urls)]
         
-        task_ids = download_manager.add_downloads_batch(urls)
+        task_ids = await run_in_threadpool(download_manager.add_downloads_batch, urls)
         return {
             "message": f"Imported {len(task_ids)} downloads",
             "task_ids": task_ids
@@ -1,6 +1,7 @@
-import json
 import os
-from typing import Dict, Any
+import threading
+import orjson
+from typing import Dict, Any, Optional
 from dataclasses import dataclass, asdict
 
 @dataclass
@@ -21,12 +22,21 @@ class DownloadSettings:
     global_chunk_size: int = 1024 * 1024  # 1MB
     max_speed_limit: int = 0  # KB/s, 0 = unlimited
 
+# Delay before a config update is flushed to disk, coalescing bursts
+SAVE_DEBOUNCE_SECONDS = 0.5
+
 class ConfigManager:
     def __init__(self):
         self.config_file = "config/config.json"
         self.settings_file = "config/settings.json"
         self.config = DownloadConfig()
         self.settings = DownloadSettings()
+        self._config_dict = None
+        self._settings_dict = None
+        self._save_timer: Optional[threading.Timer] = None
+        self._save_lock = threading.Lock()
+        # Held for a whole save so concurrent saves can't share the .tmp files
+        self._write_lock = threading.Lock()
         self.load()
 
     def load(self):
@@ -34,8 +44,8 @@ class ConfigManager:
         # Load config
         if os.path.exists(self.config_file):
             try:
-                with open(self.config_file, 'r') as f:
-                    data = json.load(f)
+                with open(self.config_file, 'rb') as f:
+                    data = orjson.loads(f.read())
                     self.config = DownloadConfig(**data)
             except Exception as e:
                 print(f"Error loading config: {e}")
@@ -46,8 +56,8 @@ class ConfigManager:
         # Load settings
         if os.path.exists(self.settings_file):
             try:
-                with open(self.settings_file, 'r') as f:
-                    data = json.load(f)
+                with open(self.settings_file, 'rb') as f:
+                    data = orjson.loads(f.read())
                     self.settings = DownloadSettings(**data)
             except Exception as e:
                 print(f"Error loading settings: {e}")
@@ -56,36 +66,81 @@ class ConfigManager:
             self.save()
 
         # Ensure download directory exists
-        os.makedirs(self.config.download_dir, exist_ok=True)
+        if not os.path.isdir(self.config.download_dir):
+            os.makedirs(self.config.download_dir, exist_ok=True)
 
     def save(self):
         """Save configuration to files"""
-        os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
-        
-        with open(self.config_file, 'w') as f:
-            json.dump(asdict(self.config), f, indent=2)
-        
-        with open(self.settings_file, 'w') as f:
-            json.dump(asdict(self.settings), f, indent=2)
+        with self._write_lock:
+            with self._save_lock:
+                if self._save_timer:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+            
+            self._config_dict = None
+            self._settings_dict = None
+            config_dir = os.path.dirname(self.config_file)
+            if not os.path.isdir(config_dir):
+                os.makedirs(config_dir, exist_ok=True)
+            
+            self._write_json(self.config_file, asdict(self.config))
+            self._write_json(self.settings_file, asdict(self.settings))
+
+    def _write_json(self, path: str, data: Dict[str, Any]):
+        """Atomically replace path with data serialized as JSON"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_path, path)
+
+    def schedule_save(self):
+        """Save after a short delay, restarting the delay on every call"""
+        with self._save_lock:
+            if self._save_timer:
+                self._save_timer.cancel()
+            self._save_timer = threading.Timer(SAVE_DEBOUNCE_SECONDS, self.save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Write any pending debounced save immediately"""
+        with self._save_lock:
+            pending = self._save_timer is not None
+        if pending:
+            self.save()
 
     def get_config(self) -> Dict[str, Any]:
         """Get config as dictionary"""
-        return asdict(self.config)
+        if self._config_dict is None:
+            self._config_dict = asdict(self.config)
+        return self._config_dict
 
     def get_settings(self) -> Dict[str, Any]:
         """Get settings as dictionary"""
-        return asdict(self.settings)
+        if self._settings_dict is None:
+            self._settings_dict = asdict(self.settings)
+        return self._settings_dict
 
     def update_config(self, updates: Dict[str, Any]):
         """Update config values"""
         for key, value in updates.items():
             if hasattr(self.config, key):
                 setattr(self.config, key, value)
-        self.save()
+        self._config_dict = None
+        self.schedule_save()
 
     def update_settings(self, updates: Dict[str, Any]):
         """Update settings values"""
         for key, value in updates.items():
             if hasattr(self.settings, key):
                 setattr(self.settings, key, value)
-        self.save()
+        self._settings_dict = None
+        self.schedule_save()
+
+    def save_config(self, updates: Dict[str, Any]):
+        """Apply config updates and persist them"""
+        self.update_config(updates)
+
+    def save_settings(self, updates: Dict[str, Any]):
+        """Apply settings updates and persist them"""
+        self.update_settings(updates)
@@ -1,65 +1,362 @@
 import os
+import re
+import json
+import math
+import array
+import random
 import requests
+from requests.adapters import HTTPAdapter
 import threading
 import time
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import Executor, ThreadPoolExecutor, wait
 from typing import Optional, Dict, List, Callable
 from urllib.parse import urlparse, unquote
 
+if hasattr(os, 'pwrite'):
+    def _pwrite(fd: int, data: bytes, offset: int):
+        """Write all of data at offset without moving the file position"""
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, offset)
+            view = view[written:]
+            offset += written
+else:
+    _seek_lock = threading.Lock()
+
+    def _pwrite(fd: int, data: bytes, offset: int):
+        """Fallback for platforms without os.pwrite (Windows)"""
+        with _seek_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+
+if hasattr(os, 'pwritev'):
+    def _pwritev(fd: int, buffers: List[bytes], offset: int):
+        """Write several buffers at offset in one syscall"""
+        written = os.pwritev(fd, buffers, offset)
+        if written < sum(len(buf) for buf in buffers):
+            _pwrite(fd, b''.join(buffers)[written:], offset + written)
+else:
+    def _pwritev(fd: int, buffers: List[bytes], offset: int):
+        """Fallback for platforms without os.pwritev"""
+        _pwrite(fd, b''.join(buffers), offset)
+
+if hasattr(os, 'posix_fadvise'):
+    def _drop_cache(fd: int, offset: int, length: int):
+        """Flush a written range to disk and evict it from the page cache"""
+        try:
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+else:
+    def _drop_cache(fd: int, offset: int, length: int):
+        """No page cache hints on this platform"""
+
+# glibc's posix_fallocate emulates a missing fallocate (NFSv3, FUSE mounts
+# such as ntfs-3g) by writing every block, so call fallocate(2) itself
+try:
+    import ctypes
+    _libc = ctypes.CDLL(None, use_errno=True)
+    _fallocate = getattr(_libc, 'fallocate64', None) or _libc.fallocate
+except (ImportError, OSError, AttributeError, TypeError):
+    _fallocate = None
+
+if _fallocate is not None:
+    _fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+    _fallocate.restype = ctypes.c_int
+
+    def _reserve(fd: int, size: int) -> bool:
+        """Allocate size bytes of fd with fallocate(2), False if the filesystem can't"""
+        return _fallocate(fd, 0, 0, size) == 0
+else:
+    def _reserve(fd: int, size: int) -> bool:
+        """No fallocate(2) on this platform"""
+        return False
+
+# Single-part downloads drop written pages from the cache this often
+DROP_CACHE_INTERVAL = 64 * 1024 * 1024
+
+# Chunk boundaries fall on multiples of this, so no filesystem block is
+# shared between two chunks' writes
+CHUNK_ALIGNMENT = 4096
+
+# Round-trip time worth one extra connection when splitting a download:
+# longer links need more requests in flight to fill the pipe. This only
+# ever adds connections on top of global_chunk_number, up to MAX_CHUNKS
+RTT_PER_CHUNK = 0.025
+MAX_CHUNKS = 16
+
+# Failed chunks back off 1, 2, 4... seconds (plus jitter) up to this
+RETRY_MAX_DELAY = 30
+
+# Client-side statuses that are still worth retrying a chunk on
+RETRY_STATUSES = (408, 429)
+
+# Received blocks are buffered per chunk until this many bytes are pending
+WRITE_BATCH_SIZE = 1024 * 1024
+
+# Smallest read issued on a response body, so a tiny global_chunk_size
+# doesn't turn into one Python iteration per TLS record
+MIN_READ_SIZE = 256 * 1024
+
+# Weight of the newest sample in the smoothed speed estimate
+SPEED_SMOOTHING = 0.2
+
+# Userspace buffer for single-part writes, coalescing several reads per write(2)
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Minimum seconds between progress callbacks; the UI can't render faster
+PROGRESS_INTERVAL = 0.1
+
+class TokenBucket:
+    """Rate limiter shared by every thread writing one download"""
+    
+    def __init__(self, rate: float):
+        self.rate = rate
+        # Holds at most one second of budget
+        self.tokens = rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def consume(self, amount: int) -> float:
+        """Take amount tokens, returning how long the caller should sleep"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if amount > self.tokens:
+                deficit = (amount - self.tokens) / self.rate
+                # The sleep pays for the deficit, so later callers start empty
+                self.tokens = 0
+                self.last = now + deficit
+                return deficit
+            self.tokens -= amount
+            return 0.0
+    
+    def throttle(self, amount: int, stop: Optional[threading.Event] = None):
+        """Consume amount tokens, sleeping off any deficit until stop is set"""
+        delay = self.consume(amount)
+        if delay:
+            if stop is None:
+                time.sleep(delay)
+            else:
+                stop.wait(delay)
+
+class ThreadLocalSessions:
+    """One requests.Session per thread, all drawing from one connection pool"""
+    
+    def __init__(self, adapter: Optional[HTTPAdapter] = None):
+        # The adapter owns the pool and is thread-safe; a Session (cookies,
+        # redirect state) is not, so threads never share one
+        self.adapter = adapter or HTTPAdapter()
+        self._local = threading.local()
+    
+    def get(self) -> requests.Session:
+        """The calling thread's session, created on first use"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            self._local.session = session
+        return session
+
+# Content-Disposition filename parameters: RFC 5987 filename*=charset''value
+# takes precedence over the plain quoted or token filename=
+_CD_FILENAME_EXT = re.compile(r"filename\*\s*=\s*([\w!#$%&+^`{}~-]+)'[^']*'([^;\s]+)", re.I)
+_CD_FILENAME = re.compile(r'filename\s*=\s*(?:"((?:[^"\\]|\\.)*)"|([^;\s]+))', re.I)
+_CD_ESCAPE = re.compile(r'\\(.)')
+
+# Content-Range of a 206: first and last byte offsets, then the total
+_CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-(\d+)/')
+
+# Names basename() can return that would point at a directory
+_UNSAFE_FILENAMES = ('', '.', '..')
+
+@lru_cache(maxsize=4096)
+def _filename_from_url(url: str) -> str:
+    """Filename taken from the URL path, or '' if it doesn't look like one"""
+    filename = os.path.basename(unquote(urlparse(url).path))
+    if '.' not in filename or filename in _UNSAFE_FILENAMES:
+        return ''
+    return filename
+
 class Downloader:
-    def __init__(self, url: str, output_path: str, config: Dict):
+    def __init__(self, url: str, output_path: str, config: Dict,
+                 executor: Optional[Executor] = None,
+                 max_workers: Optional[int] = None,
+                 sessions: Optional[ThreadLocalSessions] = None,
+                 file_info: Optional[Dict] = None,
+                 timeout: float = 30,
+                 retry_attempts: int = 3):
         self.url = url
         self.output_path = output_path
         self.config = config
+        self.timeout = timeout
+        # Extra attempts per chunk after the first one fails
+        self.retry_attempts = retry_attempts
+        self.executor = executor
+        # Most executor threads this download occupies at once, and so its
+        # most chunks; None allows one thread per chunk up to MAX_CHUNKS
+        self.max_workers = max_workers
         self.filename = ""
         self.total_size = 0
+        self.supports_range = False
+        self.etag: Optional[str] = None
+        # Seconds from sending the probe to its response headers
+        self.rtt: Optional[float] = None
+        self.probed = False
+        # Wall-clock time of the probe, so callers can tell stale file info
+        self.probed_at: Optional[float] = None
+        # Full-body response left open by probe() for _single_part_download
+        self._response: Optional[requests.Response] = None
         self.downloaded_size = 0
         self.chunks: List[Dict] = []
+        # Bytes received per chunk id, each slot written only by its chunk's
+        # thread so no lock is needed; None for single-part downloads
+        self._chunk_progress: Optional[array.array] = None
         self.active_chunks = 0
-        self.paused = False
         self.cancelled = False
+        # Set while running; cleared to park the download loops
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+        # Set by cancel() or a chunk that gave up: stops the other chunks
+        # and cuts retry backoff short
+        self._stop_event = threading.Event()
         self.error: Optional[str] = None
         self.progress_callback: Optional[Callable] = None
-        self.start_time = time.time()
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': config.user_agent or 'Mozilla/5.0'
-        })
+        self._last_progress_ts = 0.0
+        # Smoothed speed and the point it was last sampled at
+        self._speed = 0.0
+        self._speed_bytes = 0
+        self._speed_ts = 0.0
+        # Enforces max_speed_limit across all chunk threads, if set
+        self._bucket: Optional[TokenBucket] = None
+        if config.max_speed_limit:
+            self._bucket = TokenBucket(config.max_speed_limit * 1024)
+        # The sessions may be shared with other downloads, so per-download
+        # options are passed on each request instead of set on the session
+        self.sessions = sessions or ThreadLocalSessions(
+            HTTPAdapter(pool_maxsize=max(10, config.global_chunk_number))
+        )
+        self.headers = {
+            'User-Agent': config.user_agent or 'Mozilla/5.0',
+            # Ranges and Content-Length must count the file's own bytes; a
+            # compressed body would also cost a decode on every block
+            'Accept-Encoding': 'identity'
+        }
+        self.proxies = None
         
         if config.proxy:
-            self.session.proxies = {
+            self.proxies = {
                 'http': config.proxy,
                 'https': config.proxy
             }
+        
+        # Reuse file info from an earlier probe instead of probing again
+        if file_info:
+            self.url = file_info['url']
+            self.filename = file_info['filename']
+            self.total_size = file_info['total_size']
+            self.supports_range = file_info['supports_range']
+            self.etag = file_info.get('etag')
+            self.rtt = file_info.get('rtt')
+            self.probed_at = file_info.get('probed_at')
+            self.probed = True
+
+    def _request(self, method: str, headers: Optional[Dict] = None, **kwargs):
+        """Send a request for self.url with this download's headers, proxy and timeout"""
+        kwargs.setdefault('timeout', self.timeout)
+        return self.sessions.get().request(
+            method,
+            self.url,
+            headers={**self.headers, **(headers or {})},
+            proxies=self.proxies,
+            **kwargs
+        )
+
+    def _if_range(self) -> Dict[str, str]:
+        """If-Range pinning a range request to the probed file, if it has a strong ETag"""
+        # A weak or missing validator can't promise identical bytes
+        if self.etag and not self.etag.startswith('W/'):
+            return {'If-Range': self.etag}
+        return {}
+
+    def probe(self, keep_response: bool = False) -> bool:
+        """Resolve the URL and read filename, size and range support"""
+        # A range GET answers everything HEAD would, and a server that
+        # ignores the range starts sending the whole body instead. When the
+        # download follows straight away, ask for everything from byte 0 so
+        # the same response can carry the first chunk
+        probe_range = 'bytes=0-' if keep_response else 'bytes=0-0'
+        response = self._request('GET', headers={'Range': probe_range}, stream=True)
+        
+        if response.status_code not in (200, 206):
+            # Some servers reject ranges outright, retry without one
+            response.close()
+            response = self._request('GET', stream=True)
+            if response.status_code != 200:
+                response.close()
+                self.error = f"HTTP {response.status_code}"
+                return False
+        
+        # Follow redirects once; chunks go straight to the final URL
+        self.url = response.url
+        self.rtt = response.elapsed.total_seconds()
+        self.probed_at = time.time()
+        
+        # Get filename
+        self.filename = self._get_filename(response)
+        
+        # Get file size, from Content-Range if the server honoured the range
+        if response.status_code == 206:
+            total = response.headers.get('Content-Range', '').rpartition('/')[2]
+            self.total_size = int(total) if total.isdigit() else 0
+            self.supports_range = self.total_size > 0
+        else:
+            self.total_size = int(response.headers.get('Content-Length', 0))
+            self.supports_range = False
+        self.etag = response.headers.get('ETag')
+        
+        if keep_response:
+            # The body from byte 0 is already on its way, let the download
+            # consume it instead of asking again
+            self._response = response
+        elif response.status_code == 206:
+            # Drain the single byte so the connection goes back to the pool
+            response.content
+        else:
+            response.close()
+        
+        self.probed = True
+        return True
+
+    @property
+    def file_info(self) -> Dict:
+        """Probed file info, accepted back by __init__"""
+        return {
+            'url': self.url,
+            'filename': self.filename,
+            'total_size': self.total_size,
+            'supports_range': self.supports_range,
+            'etag': self.etag,
+            'rtt': self.rtt,
+            'probed_at': self.probed_at
+        }
 
     def download(self) -> bool:
         """Main download method"""
         try:
             # Get file info
-            response = self.session.head(self.url, allow_redirects=True, timeout=30)
-            
-            # Handle redirects
-            if response.status_code in [301, 302, 303, 307, 308]:
-                self.url = response.headers.get('Location', self.url)
-                response = self.session.head(self.url, allow_redirects=True, timeout=30)
-            
-            if response.status_code != 200:
-                # Try GET request instead
-                response = self.session.get(self.url, stream=True, timeout=30)
-                if response.status_code != 200:
-                    self.error = f"HTTP {response.status_code}"
-                    return False
-            
-            # Get filename
-            self.filename = self._get_filename(response)
-            
-            # Get file size
-            self.total_size = int(response.headers.get('Content-Length', 0))
-            
-            # Check if server supports range requests
-            supports_range = response.headers.get('Accept-Ranges') == 'bytes'
+            if not self.probed and not self.probe(keep_response=True):
+                return False
             
             # Determine download method
-            if supports_range and self.total_size > self.config.min_split_size:
+            if self.supports_range and self.total_size > self.config.min_split_size:
                 return self._multi_part_download()
             else:
                 return self._single_part_download()
@@ -70,56 +367,153 @@ class Downloader:
         except Exception as e:
             self.error = f"Download error: {str(e)}"
             return False
+        finally:
+            # A probe response nobody consumed still holds a connection
+            if self._response is not None:
+                self._response.close()
+                self._response = None
 
     def _get_filename(self, response) -> str:
         """Extract filename from response or URL"""
         # Try Content-Disposition header
         cd = response.headers.get('Content-Disposition')
         if cd:
-            parts = cd.split('filename=')
-            if len(parts) > 1:
-                filename = parts[1].strip('"\'')
-                if filename:
-                    return filename
+            filename = ''
+            match = _CD_FILENAME_EXT.search(cd)
+            if match:
+                try:
+                    filename = unquote(match.group(2), encoding=match.group(1),
+                                       errors='strict')
+                except (LookupError, UnicodeDecodeError):
+                    filename = ''
+            if not filename:
+                match = _CD_FILENAME.search(cd)
+                if match:
+                    filename = match.group(1) or match.group(2) or ''
+                    filename = _CD_ESCAPE.sub(r'\1', filename)
+            # Never let the server pick a directory
+            filename = os.path.basename(filename.replace('\\', '/'))
+            if filename not in _UNSAFE_FILENAMES:
+                return filename
         
         # Extract from URL
-        parsed = urlparse(self.url)
-        filename = os.path.basename(unquote(parsed.path))
+        filename = _filename_from_url(self.url)
         
-        if not filename or '.' not in filename:
+        if not filename:
             filename = f"download_{int(time.time())}"
         
         return filename
 
+    def _iter_blocks(self, response, limit: Optional[int] = None):
+        """Yield the response body in global_chunk_size blocks (at least MIN_READ_SIZE)"""
+        # Read the raw stream directly, only decoding if the server
+        # actually compressed the body
+        read = response.raw.read
+        size = max(self.config.global_chunk_size, MIN_READ_SIZE)
+        decode = 'Content-Encoding' in response.headers
+        while limit is None or limit > 0:
+            block = read(size if limit is None else min(size, limit),
+                         decode_content=decode)
+            if not block:
+                return
+            if limit is not None:
+                limit -= len(block)
+            yield block
+
+    def _covers_file(self, response: requests.Response) -> bool:
+        """Whether a response's body runs through to the file's last byte"""
+        if response.status_code != 206 or not self.total_size:
+            return True
+        return self._range_end(response) == self.total_size - 1
+
+    def _range_end(self, response: requests.Response) -> Optional[int]:
+        """Last byte offset a 206 response's Content-Range says it carries"""
+        match = _CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+        return int(match.group(2)) if match else None
+
     def _single_part_download(self) -> bool:
         """Download file in a single part"""
         try:
             filepath = os.path.join(self.output_path, self.filename)
             
-            response = self.session.get(self.url, stream=True, timeout=self.config.timeout)
+            # Reuse the body the probe already started, unless the server
+            # capped the open-ended range short of the end
+            response = self._response
+            self._response = None
+            capped = response is not None and not self._covers_file(response)
+            if capped:
+                response.close()
+                response = None
+            if response is None:
+                # Pin the body to the probed file when the server can; one
+                # that caps ranges gets a plain GET for the whole body
+                validator = self._if_range() if self.supports_range and not capped else {}
+                headers = {'Range': 'bytes=0-', **validator} if validator else None
+                response = self._request('GET', headers=headers, stream=True)
+                if response.status_code not in (200, 206):
+                    response.close()
+                    raise requests.exceptions.HTTPError(
+                        f"HTTP {response.status_code}", response=response
+                    )
+                if validator and response.status_code != 206:
+                    # If-Range fell through: the file changed since the probe
+                    response.close()
+                    raise requests.exceptions.HTTPError(
+                        "File changed on the server since it was probed",
+                        response=response
+                    )
             
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if self.cancelled:
-                        return False
-                    
-                    while self.paused:
-                        time.sleep(0.1)
+            # Bound once, these run for every block received
+            is_running = self._resume_event.is_set
+            wait_resumed = self._resume_event.wait
+            report_progress = self._report_progress
+            bucket = self._bucket
+            
+            with open(filepath, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+                if self.total_size:
+                    # Contiguous extents only; a sparse fallback buys nothing
+                    # for a sequential write
+                    self._preallocate(f.fileno(), self.total_size, sparse=False)
+                write = f.write
+                # Start of the range not yet dropped from the page cache
+                cached_from = 0
+                try:
+                    for chunk in self._iter_blocks(response):
+                        if not is_running():
+                            # Put buffered bytes on disk while parked
+                            f.flush()
+                            wait_resumed()
                         if self.cancelled:
                             return False
-                    
-                    if chunk:
-                        f.write(chunk)
-                        self.downloaded_size += len(chunk)
                         
-                        if self.progress_callback:
-                            speed = self._calculate_speed()
-                            self.progress_callback(
-                                self.downloaded_size,
-                                self.total_size,
-                                speed
-                            )
+                        if chunk:
+                            write(chunk)
+                            self.downloaded_size += len(chunk)
+                            
+                            if bucket:
+                                bucket.throttle(len(chunk), self._stop_event)
+                            
+                            if self.downloaded_size - cached_from >= DROP_CACHE_INTERVAL:
+                                f.flush()
+                                _drop_cache(f.fileno(), cached_from,
+                                            self.downloaded_size - cached_from)
+                                cached_from = self.downloaded_size
+                            
+                            report_progress()
+                finally:
+                    # Trim the reservation to what actually arrived, also
+                    # when the transfer fails or is cancelled part way
+                    f.truncate(self.downloaded_size)
+            
+            # A short body ends the stream like a complete one; compressed
+            # bodies decode to a size Content-Length doesn't describe
+            if (self.total_size and self.downloaded_size != self.total_size
+                    and 'Content-Encoding' not in response.headers):
+                self.error = (f"Received {self.downloaded_size} of "
+                              f"{self.total_size} bytes")
+                return False
             
+            self._report_progress(force=True)
             return True
             
         except Exception as e:
@@ -131,53 +525,72 @@ class Downloader:
         try:
             filepath = os.path.join(self.output_path, self.filename)
             
-            # Calculate chunk size and count
-            chunk_count = min(self.config.global_chunk_number, 
-                             max(1, self.total_size // self.config.min_split_size))
-            chunk_size = self.total_size // chunk_count
+            temp_path = filepath + '.tmp'
+            progress_path = temp_path + '.progress'
             
-            # Create chunks
-            self.chunks = []
-            for i in range(chunk_count):
-                start = i * chunk_size
-                end = start + chunk_size - 1 if i < chunk_count - 1 else self.total_size - 1
-                
-                self.chunks.append({
-                    'id': i,
-                    'start': start,
-                    'end': end,
-                    'downloaded': 0,
-                    'status': 'pending'
-                })
+            # Create temporary file, opened once and shared by all chunks
+            fd = os.open(temp_path,
+                         os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0),
+                         0o644)
             
-            # Create temporary file
-            with open(filepath + '.tmp', 'wb') as f:
-                f.seek(self.total_size - 1)
-                f.write(b'\0')
+            # Pick up where a previous attempt left off, if it can be trusted.
+            # Earlier attempts preallocated the full size, a new file is empty
+            self.chunks = []
+            if os.fstat(fd).st_size == self.total_size:
+                self.chunks = self._load_chunk_progress(progress_path)
+            if not self.chunks:
+                self.chunks = self._create_chunks()
+            chunk_count = len(self.chunks)
+            self._chunk_progress = array.array(
+                'q', [chunk['downloaded'] for chunk in self.chunks]
+            )
+            self.downloaded_size = sum(self._chunk_progress)
             
-            # Download chunks in parallel
-            threads = []
-            for chunk in self.chunks:
-                thread = threading.Thread(
-                    target=self._download_chunk,
-                    args=(chunk, filepath + '.tmp')
-                )
-                thread.start()
-                threads.append(thread)
+            # At most max_workers chunks run at once, even for a resumed
+            # sidecar that was split further than that
+            workers = min(chunk_count, self.max_workers or chunk_count)
             
-            # Wait for all threads
-            for thread in threads:
-                thread.join()
+            # Download chunks in parallel on the shared pool, or a private
+            # one bounded by the worker count if none was injected
+            executor = self.executor or ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix='chunk'
+            )
+            try:
+                self._preallocate(fd, self.total_size)
+                # The probe's open response already starts at byte 0
+                first_response = self._response
+                self._response = None
+                if first_response is not None and self.chunks[0]['downloaded']:
+                    first_response.close()
+                    first_response = None
+                # Chunk 0 is taken first, so the probe's socket isn't left
+                # idle behind the other chunks
+                todo = deque(self.chunks)
+                futures = [
+                    executor.submit(self._run_chunks, todo, fd, first_response)
+                    for _ in range(workers)
+                ]
+                wait(futures)
+                self.downloaded_size = sum(self._chunk_progress)
+            finally:
+                os.close(fd)
+                if executor is not self.executor:
+                    executor.shutdown(wait=False)
             
             # Check if all chunks completed
             if self.cancelled:
-                os.remove(filepath + '.tmp')
+                os.remove(temp_path)
+                self._remove_chunk_progress(progress_path)
                 return False
             
             if all(chunk['status'] == 'completed' for chunk in self.chunks):
-                os.rename(filepath + '.tmp', filepath)
+                os.rename(temp_path, filepath)
+                self._remove_chunk_progress(progress_path)
+                self._report_progress(force=True)
                 return True
             else:
+                self._save_chunk_progress(progress_path)
                 self.error = "Some chunks failed to download"
                 return False
                 
@@ -185,74 +598,292 @@ class Downloader:
             self.error = str(e)
             return False
 
-    def _download_chunk(self, chunk: Dict, filepath: str):
-        """Download a single chunk"""
-        try:
-            headers = {
-                'Range': f"bytes={chunk['start']}-{chunk['end']}"
-            }
-            
-            response = self.session.get(
-                self.url,
-                headers=headers,
-                stream=True,
-                timeout=self.config.timeout
-            )
+    def _create_chunks(self) -> List[Dict]:
+        """Split the file into global_chunk_number byte ranges, more on slow links"""
+        chunk_count = self.config.global_chunk_number
+        if self.rtt is not None:
+            # High latency needs more requests in flight than configured
+            chunk_count = max(chunk_count,
+                              min(MAX_CHUNKS, math.ceil(self.rtt / RTT_PER_CHUNK)))
+        if self.max_workers:
+            chunk_count = min(chunk_count, self.max_workers)
+        chunk_count = min(chunk_count,
+                          max(1, self.total_size // self.config.min_split_size))
+        # Every chunk but the last spans at least one aligned block, or a
+        # tiny min_split_size would round chunk_size down to 0
+        chunk_count = min(chunk_count, max(1, self.total_size // CHUNK_ALIGNMENT))
+        chunk_size = self.total_size // chunk_count // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT
+        
+        chunks = []
+        for i in range(chunk_count):
+            start = i * chunk_size
+            end = start + chunk_size - 1 if i < chunk_count - 1 else self.total_size - 1
             
-            if response.status_code not in [200, 206]:
-                chunk['status'] = 'failed'
+            chunks.append({
+                'id': i,
+                'start': start,
+                'end': end,
+                'downloaded': 0,
+                'status': 'pending'
+            })
+        return chunks
+
+    def _load_chunk_progress(self, progress_path: str) -> List[Dict]:
+        """Chunks saved by an earlier attempt on the same file, or []"""
+        try:
+            with open(progress_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return []
+        
+        # Only resume if the remote file is provably unchanged: without a
+        # strong ETag a .tmp of the same size may hold another file's bytes
+        if not self._if_range():
+            return []
+        if data.get('total_size') != self.total_size or data.get('etag') != self.etag:
+            return []
+        
+        return [
+            {**chunk, 'status': 'pending'}
+            for chunk in data.get('chunks', [])
+        ]
+
+    def _save_chunk_progress(self, progress_path: str):
+        """Record how far each chunk got so a later attempt can resume"""
+        data = {
+            'total_size': self.total_size,
+            'etag': self.etag,
+            'chunks': [
+                {
+                    'id': chunk['id'],
+                    'start': chunk['start'],
+                    'end': chunk['end'],
+                    'downloaded': chunk['downloaded']
+                }
+                for chunk in self.chunks
+            ]
+        }
+        try:
+            with open(progress_path, 'w') as f:
+                json.dump(data, f)
+        except OSError:
+            pass
+
+    def _remove_chunk_progress(self, progress_path: str):
+        """Delete the resume sidecar once it is no longer needed"""
+        try:
+            os.remove(progress_path)
+        except FileNotFoundError:
+            pass
+
+    def _preallocate(self, fd: int, size: int, sparse: bool = True):
+        """Reserve disk space for the whole file up front"""
+        # Set the exact length first: fallocate never shrinks, so a longer
+        # leftover .tmp would keep its stale tail
+        if sparse:
+            os.ftruncate(fd, size)
+        # Only a real fallocate: an emulated one would write the whole file
+        # once before the download writes it again
+        _reserve(fd, size)
+
+    def _run_chunks(self, todo: deque, fd: int,
+                    first_response: Optional[requests.Response] = None):
+        """Download queued chunks one after another on a single executor thread"""
+        while True:
+            try:
+                chunk = todo.popleft()
+            except IndexError:
+                return
+            self._download_chunk(chunk, fd,
+                                 first_response if chunk['id'] == 0 else None)
+
+    def _download_chunk(self, chunk: Dict, fd: int,
+                        response: Optional[requests.Response] = None):
+        """Download a single chunk, retrying from where it stopped on failure"""
+        stop = self._stop_event
+        for attempt in range(self.retry_attempts + 1):
+            # Cancelled, or another chunk already failed the download
+            if stop.is_set():
+                if response is not None:
+                    response.close()
                 return
+            try:
+                self._fetch_chunk(chunk, fd, response)
+                return
+            except requests.exceptions.HTTPError as e:
+                chunk['status'] = 'failed'
+                chunk['error'] = str(e)
+                # Only server-side and rate-limit errors are worth repeating
+                status = e.response.status_code if e.response is not None else 0
+                if status < 500 and status not in RETRY_STATUSES:
+                    break
+            except Exception as e:
+                chunk['status'] = 'failed'
+                chunk['error'] = str(e)
             
-            chunk['status'] = 'downloading'
+            # Later attempts issue their own range request
+            response = None
+            if attempt < self.retry_attempts:
+                # Exponential backoff with jitter, cut short by stop
+                stop.wait(min(2 ** attempt, RETRY_MAX_DELAY) + random.random())
+        
+        # The download can't complete now: stop the other chunks instead of
+        # letting them stream on, their progress is saved for a resume
+        stop.set()
+
+    def _fetch_chunk(self, chunk: Dict, fd: int,
+                     response: Optional[requests.Response] = None):
+        """Fetch what is still missing of a chunk into the shared file descriptor"""
+        chunk['status'] = 'downloading'
+        
+        pending: List[bytes] = []
+        pending_size = 0
+        chunk_progress = self._chunk_progress
+        index = chunk['id']
+        received = chunk['downloaded']
+        wait_resumed = self._resume_event.wait
+        stopped = self._stop_event.is_set
+        report_progress = self._report_progress
+        bucket = self._bucket
+        append = pending.append
+        
+        while True:
+            # Resumed chunks only fetch what is still missing
+            start = chunk['start'] + chunk['downloaded']
+            if start > chunk['end']:
+                # Nothing to read from a response handed in for this chunk
+                if response is not None:
+                    response.close()
+                break
             
-            with open(filepath, 'r+b') as f:
-                f.seek(chunk['start'])
+            # A response passed in (the probe's) already starts at start
+            if response is None:
+                # A changed file answers 200 instead, which fails the chunk
+                headers = {
+                    'Range': f"bytes={start}-{chunk['end']}",
+                    **self._if_range()
+                }
                 
-                for data in response.iter_content(chunk_size=8192):
-                    if self.cancelled:
-                        chunk['status'] = 'cancelled'
+                response = self._request(
+                    'GET',
+                    headers=headers,
+                    stream=True
+                )
+            
+            # A plain 200 would be the whole file, not this range
+            if response.status_code != 206:
+                response.close()
+                raise requests.exceptions.HTTPError(
+                    f"HTTP {response.status_code} for range request",
+                    response=response
+                )
+            
+            # Stop at the chunk's end even if the response runs past it, and
+            # at the response's end if the server capped the range short of it
+            end = chunk['end']
+            range_end = self._range_end(response)
+            if range_end is not None:
+                end = min(end, range_end)
+            
+            try:
+                for data in self._iter_blocks(response, end - start + 1):
+                    wait_resumed()
+                    if stopped():
+                        chunk['status'] = 'cancelled' if self.cancelled else 'pending'
                         return
                     
-                    while self.paused:
-                        time.sleep(0.1)
-                        if self.cancelled:
-                            chunk['status'] = 'cancelled'
-                            return
-                    
                     if data:
-                        f.write(data)
-                        chunk['downloaded'] += len(data)
-                        self.downloaded_size += len(data)
+                        size = len(data)
+                        append(data)
+                        pending_size += size
+                        if pending_size >= WRITE_BATCH_SIZE:
+                            self._write_chunk_data(fd, chunk, pending, pending_size)
+                            pending.clear()
+                            pending_size = 0
                         
-                        if self.progress_callback:
-                            speed = self._calculate_speed()
-                            self.progress_callback(
-                                self.downloaded_size,
-                                self.total_size,
-                                speed
-                            )
-            
-            chunk['status'] = 'completed'
+                        received += size
+                        chunk_progress[index] = received
+                        
+                        if bucket:
+                            bucket.throttle(size, self._stop_event)
+                        
+                        report_progress()
+            finally:
+                # Keep whatever arrived so a resumed attempt can skip it
+                if pending:
+                    self._write_chunk_data(fd, chunk, pending, pending_size)
+                    pending.clear()
+                    pending_size = 0
+                response.close()
+            response = None
             
-        except Exception as e:
-            chunk['status'] = 'failed'
-            chunk['error'] = str(e)
+            # A body that ended early is a failure, but one that delivered its
+            # whole capped range just continues with a request for the rest
+            reached = chunk['start'] + chunk['downloaded']
+            if reached <= end or reached == start:
+                raise requests.exceptions.ChunkedEncodingError(
+                    "Connection closed before the chunk was complete"
+                )
+        
+        # The finished range won't be read again before the rename
+        _drop_cache(fd, chunk['start'], chunk['end'] - chunk['start'] + 1)
+        chunk['status'] = 'completed'
+
+    def _write_chunk_data(self, fd: int, chunk: Dict, buffers: List[bytes], size: int):
+        """Write buffered blocks at the end of a chunk's downloaded range"""
+        _pwritev(fd, buffers, chunk['start'] + chunk['downloaded'])
+        chunk['downloaded'] += size
+
+    def _report_progress(self, force: bool = False):
+        """Call progress_callback, at most once per PROGRESS_INTERVAL unless forced"""
+        if not self.progress_callback:
+            return
+        
+        now = time.monotonic()
+        if not force and now - self._last_progress_ts < PROGRESS_INTERVAL:
+            return
+        self._last_progress_ts = now
+        
+        if self._chunk_progress is not None:
+            self.downloaded_size = sum(self._chunk_progress)
+        
+        self.progress_callback(
+            self.downloaded_size,
+            self.total_size,
+            self._calculate_speed()
+        )
 
     def _calculate_speed(self) -> float:
-        """Calculate download speed in bytes per second"""
-        elapsed = time.time() - self.start_time
+        """Exponential moving average of the download speed in bytes per second"""
+        now = time.monotonic()
+        if not self._speed_ts:
+            # First call only sets the baseline, so resumed bytes don't count
+            self._speed_ts = now
+            self._speed_bytes = self.downloaded_size
+            return 0.0
+        
+        elapsed = now - self._speed_ts
         if elapsed > 0:
-            return self.downloaded_size / elapsed
-        return 0
+            sample = (self.downloaded_size - self._speed_bytes) / elapsed
+            if self._speed:
+                self._speed += SPEED_SMOOTHING * (sample - self._speed)
+            else:
+                self._speed = sample
+            self._speed_ts = now
+            self._speed_bytes = self.downloaded_size
+        return self._speed
 
     def pause(self):
         """Pause the download"""
-        self.paused = True
+        self._resume_event.clear()
 
     def resume(self):
         """Resume the download"""
-        self.paused = False
+        self._resume_event.set()
 
     def cancel(self):
         """Cancel the download"""
         self.cancelled = True
+        self._stop_event.set()
+        # Wake paused loops so they can observe the cancellation
+        self._resume_event.set()
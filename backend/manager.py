@@ -1,18 +1,31 @@
 import os
-import json
+import sys
 import uuid
 import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
 from dataclasses import dataclass, field
 from datetime import datetime
-from queue import Queue, Empty
+from queue import Queue
 import time
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from .downloader import Downloader
-from .config import ConfigManager
-from .progress import ProgressTracker
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
-@dataclass
+from .downloader import Downloader, ThreadLocalSessions, MAX_CHUNKS
+from .config import ConfigManager, SAVE_DEBOUNCE_SECONDS
+
+# slots=True needs Python 3.10; setup.sh still supports 3.8
+DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**DATACLASS_SLOTS)
 class DownloadTask:
     id: str
     url: str
@@ -28,21 +41,158 @@ class DownloadTask:
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
     chunks: List[Dict] = field(default_factory=list)
+    file_info: Optional[Dict] = None  # probed by prepare_download
+
+# Seconds a probe stays usable. Its URL is the redirect target, often a
+# short-lived signed link, so only a prompt start may skip the probe
+FILE_INFO_MAX_AGE = 60
+
+# Most URLs whose probe results are kept; the oldest is dropped first
+PROBE_CACHE_SIZE = 256
+
+# Upper bound on concurrent probes for one batch of URLs
+PROBE_WORKERS = 16
+
+# Share of the open-file soft limit that chunk sockets may use; the rest is
+# left for temp files, probes, the API server and config writes
+FD_BUDGET_SHARE = 2
+
+# Seconds stop() waits in total for worker threads to exit
+WORKER_STOP_TIMEOUT = 5
+
+# Task status -> group name returned by get_all_downloads
+STATUS_GROUPS = {
+    "downloading": "active",
+    "queued": "queued",
+    "paused": "paused",
+    "completed": "completed",
+    "failed": "failed"
+}
 
 class DownloadManager:
     def __init__(self):
         self.config_manager = ConfigManager()
         self.tasks: Dict[str, DownloadTask] = {}
+        # Tasks indexed by status, kept in sync by _set_status
+        self._by_status: Dict[str, Dict[str, DownloadTask]] = defaultdict(dict)
         self.download_queue = Queue()
         self.active_downloads: Dict[str, Downloader] = {}
-        self.progress_tracker = ProgressTracker()
+        # Probe results per URL, kept only for responses with a strong ETag
+        self._probe_cache: Dict[str, Dict] = {}
         self.running = False
         self.worker_threads = []
         self.lock = threading.Lock()
+        self._save_timer: Optional[threading.Timer] = None
+        self._save_lock = threading.Lock()
+        # Held for a whole save so concurrent saves can't share the .tmp file
+        self._write_lock = threading.Lock()
+        # Each running download gets an equal share of the chunk pool and
+        # never more, so paused or slow downloads can't starve the others
+        max_concurrent = self.config_manager.config.max_concurrent_downloads
+        self.chunk_share = max(1, self._chunk_thread_count() // max_concurrent)
+        self.chunk_threads = self.chunk_share * max_concurrent
+        
+        # Per-thread sessions over one pool so downloads reuse keep-alive
+        # connections
+        self.sessions = ThreadLocalSessions(self._create_adapter())
+        
+        # Shared pool for multi-part chunk transfers across all downloads
+        self.chunk_executor = ThreadPoolExecutor(
+            max_workers=self.chunk_threads,
+            thread_name_prefix='chunk'
+        )
         
         # Load saved tasks
         self.load_tasks()
 
+    def _add_task(self, task: DownloadTask):
+        """Register a task (caller holds self.lock)"""
+        self.tasks[task.id] = task
+        self._by_status[task.status][task.id] = task
+
+    def _remove_task(self, task_id: str):
+        """Forget a task (caller holds self.lock)"""
+        task = self.tasks.pop(task_id)
+        self._by_status[task.status].pop(task_id, None)
+
+    def _set_status(self, task: DownloadTask, status: str):
+        """Change a task's status and move it between buckets (caller holds self.lock)"""
+        self._by_status[task.status].pop(task.id, None)
+        task.status = status
+        self._by_status[status][task.id] = task
+
+    def _create_downloader(self, url: str,
+                           file_info: Optional[Dict] = None) -> Downloader:
+        """Create a Downloader wired to the shared sessions and chunk pool"""
+        return Downloader(
+            url=url,
+            output_path=self.config_manager.config.download_dir,
+            config=self.config_manager.settings,
+            executor=self.chunk_executor,
+            max_workers=self.chunk_share,
+            sessions=self.sessions,
+            file_info=file_info,
+            timeout=self.config_manager.config.timeout,
+            retry_attempts=self.config_manager.config.retry_attempts
+        )
+
+    def _remember_probe(self, url: str, downloader: Downloader):
+        """Cache a downloader's probe if the server identified the file strongly"""
+        etag = downloader.etag
+        if not (downloader.probed and etag and not etag.startswith('W/')):
+            return
+        with self.lock:
+            cache = self._probe_cache
+            # Re-insert so eviction order follows the latest probe
+            cache.pop(url, None)
+            cache[url] = downloader.file_info
+            if len(cache) > PROBE_CACHE_SIZE:
+                del cache[next(iter(cache))]
+
+    def _fresh_file_info(self, task: DownloadTask) -> Optional[Dict]:
+        """The task's or cached probe of its URL, if recent enough to trust"""
+        now = time.time()
+        for file_info in (task.file_info, self._probe_cache.get(task.url)):
+            if file_info and now - (file_info.get('probed_at') or 0) <= FILE_INFO_MAX_AGE:
+                return file_info
+        return None
+
+    def _forget_probe(self, url: str):
+        """Drop a cached probe that a download could not complete with"""
+        with self.lock:
+            self._probe_cache.pop(url, None)
+
+    def _chunk_thread_count(self) -> int:
+        """Chunk workers for all downloads, kept within the open-file limit"""
+        # Enough for every download to split as far as latency may ask
+        per_download = max(self.config_manager.settings.global_chunk_number, MAX_CHUNKS)
+        threads = per_download * self.config_manager.config.max_concurrent_downloads
+        if resource is None:
+            return threads
+        
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft == resource.RLIM_INFINITY:
+            return threads
+        
+        budget = max(4, soft // FD_BUDGET_SHARE)
+        if threads > budget:
+            # Every chunk thread holds a socket; past the limit connects and
+            # opens fail with "Too many open files"
+            print(f"Limiting chunk threads to {budget} (open file limit {soft})")
+            return budget
+        return threads
+
+    def _create_adapter(self) -> HTTPAdapter:
+        """Create the connection pool shared by all downloads"""
+        # Every chunk thread may hold a connection to the same host at once,
+        # plus up to PROBE_WORKERS batch probes. Not blocking: anything that
+        # overflows the pool gets a throwaway connection instead of stalling
+        return HTTPAdapter(
+            pool_connections=64,
+            pool_maxsize=self.chunk_threads + PROBE_WORKERS,
+            max_retries=Retry(total=5, backoff_factor=0.5)
+        )
+
     def start(self):
         """Start the download manager"""
         self.running = True
@@ -61,22 +211,36 @@ class DownloadManager:
         """Stop the download manager"""
         self.running = False
         
+        # Wake each idle worker with a sentinel so it exits
+        for _ in self.worker_threads:
+            self.download_queue.put(None)
+        
         # Cancel all active downloads
         for task_id in list(self.active_downloads.keys()):
             self.cancel_download(task_id)
         
-        # Save tasks
+        # Give workers a moment to unwind their cancelled downloads
+        deadline = time.monotonic() + WORKER_STOP_TIMEOUT
+        for thread in self.worker_threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self.worker_threads = [t for t in self.worker_threads if t.is_alive()]
+        
+        # Save tasks and any pending config edits
         self.save_tasks()
+        self.config_manager.flush()
+        
+        self.chunk_executor.shutdown(wait=False)
 
     def _worker(self):
         """Worker thread that processes downloads"""
-        while self.running:
+        while True:
+            # Block until work arrives; None is the shutdown sentinel
+            task_id = self.download_queue.get()
+            if task_id is None or not self.running:
+                return
             try:
-                task_id = self.download_queue.get(timeout=1)
                 if task_id in self.tasks:
                     self._process_download(task_id)
-            except Empty:
-                continue
             except Exception as e:
                 print(f"Worker error: {e}")
 
@@ -87,88 +251,123 @@ class DownloadManager:
         try:
             # Update status
             with self.lock:
-                task.status = "downloading"
+                self._set_status(task, "downloading")
                 task.start_time = datetime.now()
             
-            # Create downloader
-            downloader = Downloader(
-                url=task.url,
-                output_path=self.config_manager.config.download_dir,
-                config=self.config_manager.settings
-            )
+            # Create downloader, reusing a recent probe of this URL. The task
+            # keeps its original URL; later runs (resume, retry) probe again
+            file_info = self._fresh_file_info(task)
+            task.file_info = None
+            downloader = self._create_downloader(task.url, file_info)
             
             # Store in active downloads
             with self.lock:
                 self.active_downloads[task_id] = downloader
             
             # Set progress callback
+            download_dir = self.config_manager.config.download_dir
+            
             def progress_callback(downloaded, total, speed):
-                with self.lock:
-                    task.downloaded_size = downloaded
-                    task.total_size = total
-                    task.speed = speed
-                    task.progress = (downloaded / total * 100) if total > 0 else 0
-                    task.eta = int((total - downloaded) / speed) if speed > 0 else 0
-                    
-                    # Update filename if not set
-                    if not task.filename and downloader.filename:
+                # Only this download writes these fields and each assignment
+                # is atomic, so status readers never wait on the global lock
+                task.downloaded_size = downloaded
+                task.total_size = total
+                task.speed = speed
+                task.progress = (downloaded / total * 100) if total > 0 else 0
+                task.eta = int((total - downloaded) / speed) if speed > 0 else 0
+                
+                # Update filename if not set
+                if not task.filename and downloader.filename:
+                    with self.lock:
                         task.filename = downloader.filename
-                        task.filepath = os.path.join(
-                            self.config_manager.config.download_dir,
-                            task.filename
-                        )
+                        task.filepath = os.path.join(download_dir, task.filename)
             
             downloader.progress_callback = progress_callback
             
             # Start download
             success = downloader.download()
+            # A failure may mean the cached file info went stale
+            if success:
+                self._remember_probe(task.url, downloader)
+            else:
+                self._forget_probe(task.url)
             
             # Update task status
             with self.lock:
                 if success:
-                    task.status = "completed"
+                    self._set_status(task, "completed")
                     task.end_time = datetime.now()
                     task.progress = 100.0
                 else:
                     if task.status != "cancelled":
-                        task.status = "failed"
+                        self._set_status(task, "failed")
                         task.error = downloader.error or "Unknown error"
                 
                 # Remove from active downloads
                 if task_id in self.active_downloads:
                     del self.active_downloads[task_id]
             
+            self.schedule_save_tasks()
+            
         except Exception as e:
             with self.lock:
-                task.status = "failed"
+                self._set_status(task, "failed")
                 task.error = str(e)
                 if task_id in self.active_downloads:
                     del self.active_downloads[task_id]
 
-    def add_download(self, url: str) -> str:
+    def prepare_download(self, url: str) -> Optional[Dict]:
+        """Probe a URL ahead of queueing it, returning its file info"""
+        downloader = self._create_downloader(url)
+        try:
+            if downloader.probe():
+                self._remember_probe(url, downloader)
+                return downloader.file_info
+        except (requests.exceptions.RequestException, ValueError):
+            # The downloader probes again when the task starts
+            pass
+        return None
+
+    def add_download(self, url: str, file_info: Optional[Dict] = None) -> str:
         """Add a new download"""
         task_id = str(uuid.uuid4())
         
         task = DownloadTask(
             id=task_id,
-            url=url
+            url=url,
+            file_info=file_info
         )
+        if file_info:
+            task.filename = file_info['filename']
+            task.filepath = os.path.join(
+                self.config_manager.config.download_dir,
+                task.filename
+            )
+            task.total_size = file_info['total_size']
         
         with self.lock:
-            self.tasks[task_id] = task
+            self._add_task(task)
         
         # Add to queue if auto-start is enabled
         if self.config_manager.settings.auto_start:
             self.download_queue.put(task_id)
         
-        self.save_tasks()
+        self.schedule_save_tasks()
         return task_id
 
-    def add_downloads_batch(self, urls: List[str]) -> List[str]:
+    def add_downloads_batch(self, urls: List[str],
+                            file_infos: Optional[List[Optional[Dict]]] = None) -> List[str]:
         """Add multiple downloads"""
+        if file_infos is None and urls:
+            # Probes are independent, so run them side by side instead of
+            # paying one round trip per URL
+            with ThreadPoolExecutor(max_workers=min(PROBE_WORKERS, len(urls)),
+                                    thread_name_prefix='probe') as executor:
+                file_infos = list(executor.map(self.prepare_download, urls))
+        file_infos = file_infos or []
         task_ids = []
-        for url in urls:
-            task_id = self.add_download(url)
+        for url, file_info in zip(urls, file_infos):
+            task_id = self.add_download(url, file_info)
             task_ids.append(task_id)
         return task_ids
 
@@ -177,136 +376,137 @@ class DownloadManager:
         with self.lock:
             if task_id in self.active_downloads:
                 self.active_downloads[task_id].pause()
-                self.tasks[task_id].status = "paused"
+                self._set_status(self.tasks[task_id], "paused")
 
     def resume_download(self, task_id: str):
         """Resume a download"""
         with self.lock:
             task = self.tasks.get(task_id)
-            if task and task.status in ["paused", "failed"]:
-                task.status = "queued"
+            downloader = self.active_downloads.get(task_id)
+            if task and task.status == "paused" and downloader:
+                # Still parked on its worker and chunk threads: wake it
+                # rather than queueing a second download of the same file
+                downloader.resume()
+                self._set_status(task, "downloading")
+            elif task and task.status in ["paused", "failed"]:
+                self._set_status(task, "queued")
                 task.error = None
                 self.download_queue.put(task_id)
 
     def cancel_download(self, task_id: str):
         """Cancel a download"""
+        filepath = None
         with self.lock:
             if task_id in self.active_downloads:
                 self.active_downloads[task_id].cancel()
             
             if task_id in self.tasks:
-                self.tasks[task_id].status = "cancelled"
-                
-                # Remove file if partially downloaded
                 task = self.tasks[task_id]
-                if task.filepath and os.path.exists(task.filepath):
-                    try:
-                        os.remove(task.filepath)
-                    except:
-                        pass
+                self._set_status(task, "cancelled")
+                filepath = task.filepath
+        
+        # Remove file if partially downloaded, outside the lock so a slow
+        # filesystem doesn't stall status reads
+        if filepath:
+            try:
+                os.remove(filepath)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error removing {filepath}: {e}")
 
     def get_download_status(self, task_id: str) -> Optional[DownloadTask]:
         """Get status of a download"""
-        with self.lock:
-            return self.tasks.get(task_id)
+        return self.tasks.get(task_id)
 
     def get_all_downloads(self) -> Dict[str, List[DownloadTask]]:
         """Get all downloads grouped by status"""
         with self.lock:
-            result = {
-                "active": [],
-                "queued": [],
-                "paused": [],
-                "completed": [],
-                "failed": []
+            return {
+                group: list(self._by_status[status].values())
+                for status, group in STATUS_GROUPS.items()
             }
-            
-            for task in self.tasks.values():
-                if task.status == "downloading":
-                    result["active"].append(task)
-                elif task.status == "queued":
-                    result["queued"].append(task)
-                elif task.status == "paused":
-                    result["paused"].append(task)
-                elif task.status == "completed":
-                    result["completed"].append(task)
-                elif task.status == "failed":
-                    result["failed"].append(task)
-            
-            return result
 
     def clear_completed(self):
         """Clear completed downloads from the list"""
         with self.lock:
-            completed_ids = [
-                task_id for task_id, task in self.tasks.items()
-                if task.status == "completed"
-            ]
-            
-            for task_id in completed_ids:
-                del self.tasks[task_id]
+            for task_id in list(self._by_status["completed"]):
+                self._remove_task(task_id)
         
-        self.save_tasks()
+        self.schedule_save_tasks()
 
     def retry_failed(self):
         """Retry all failed downloads"""
         with self.lock:
-            failed_tasks = [
-                task for task in self.tasks.values()
-                if task.status == "failed"
-            ]
+            failed_tasks = list(self._by_status["failed"].values())
             
             for task in failed_tasks:
-                task.status = "queued"
+                self._set_status(task, "queued")
                 task.error = None
                 self.download_queue.put(task.id)
 
     def resume_all(self):
         """Resume all paused/incomplete downloads"""
         with self.lock:
-            resumable_tasks = [
-                task for task in self.tasks.values()
-                if task.status in ["paused", "downloading"]
-            ]
+            resumable_tasks = (
+                list(self._by_status["paused"].values()) +
+                list(self._by_status["downloading"].values())
+            )
             
             for task in resumable_tasks:
-                task.status = "queued"
+                self._set_status(task, "queued")
                 self.download_queue.put(task.id)
 
+    def schedule_save_tasks(self):
+        """Save tasks after a short delay, coalescing bursts of changes"""
+        with self._save_lock:
+            if self._save_timer:
+                self._save_timer.cancel()
+            self._save_timer = threading.Timer(SAVE_DEBOUNCE_SECONDS, self.save_tasks)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
     def save_tasks(self):
         """Save tasks to file"""
-        try:
-            tasks_data = {}
-            with self.lock:
-                for task_id, task in self.tasks.items():
-                    # Only save non-completed tasks
-                    if task.status != "completed":
-                        tasks_data[task_id] = {
-                            "id": task.id,
-                            "url": task.url,
-                            "filename": task.filename,
-                            "filepath": task.filepath,
-                            "total_size": task.total_size,
-                            "downloaded_size": task.downloaded_size,
-                            "status": "paused" if task.status == "downloading" else task.status,
-                            "chunks": task.chunks
-                        }
+        with self._write_lock:
+            with self._save_lock:
+                if self._save_timer:
+                    self._save_timer.cancel()
+                    self._save_timer = None
             
-            os.makedirs("config", exist_ok=True)
-            with open("config/tasks.json", "w") as f:
-                json.dump(tasks_data, f, indent=2)
-        except Exception as e:
-            print(f"Error saving tasks: {e}")
+            try:
+                tasks_data = {}
+                with self.lock:
+                    for task_id, task in self.tasks.items():
+                        # Only save non-completed tasks
+                        if task.status != "completed":
+                            tasks_data[task_id] = {
+                                "id": task.id,
+                                "url": task.url,
+                                "filename": task.filename,
+                                "filepath": task.filepath,
+                                "total_size": task.total_size,
+                                "downloaded_size": task.downloaded_size,
+                                "status": "paused" if task.status == "downloading" else task.status,
+                                "chunks": task.chunks
+                            }
+                
+                if not os.path.isdir("config"):
+                    os.makedirs("config", exist_ok=True)
+                with open("config/tasks.json.tmp", "wb") as f:
+                    f.write(orjson.dumps(tasks_data, option=orjson.OPT_INDENT_2))
+                os.replace("config/tasks.json.tmp", "config/tasks.json")
+            except Exception as e:
+                print(f"Error saving tasks: {e}")
 
     def load_tasks(self):
         """Load tasks from file"""
         try:
             if os.path.exists("config/tasks.json"):
-                with open("config/tasks.json", "r") as f:
-                    tasks_data = json.load(f)
+                with open("config/tasks.json", "rb") as f:
+                    tasks_data = orjson.loads(f.read())
                 
                 for task_id, data in tasks_data.items():
-                    task = DownloadTask(**data)
-                    self.tasks[task_id] = task
+                    self._add_task(DownloadTask(**data))
         except Exception as e:
             print(f"Error loading tasks: {e}")
@@ -0,0 +1,17 @@
+from functools import partial
+from pathlib import Path
+
+import orjson
+from pydantic import AnyUrl
+
+# Options shared by every orjson.dumps call in the API
+ORJSON_OPTS = orjson.OPT_NON_STR_KEYS
+
+def _orjson_default(obj):
+    """Serialize values orjson doesn't handle natively"""
+    if isinstance(obj, (AnyUrl, Path)):
+        return str(obj)
+    raise TypeError
+
+# Encode content to JSON bytes with orjson
+dumps = partial(orjson.dumps, default=_orjson_default, option=ORJSON_OPTS)
@@ -1,9 +1,12 @@
 import requests
 import json
 
+# One session so both requests share a keep-alive connection
+session = requests.Session()
+
 # Test if server is running
 try:
-    response = requests.get("http://localhost:8000/api/downloads")
+    response = session.get("http://localhost:8000/api/downloads")
     print(f"API Status: {response.status_code}")
     print(f"Response: {json.dumps(response.json(), indent=2)}")
 except Exception as e:
@@ -12,7 +15,7 @@ except Exception as e:
 # Test adding a download
 try:
     test_url = "https://www.w3.org/WAI/ER/tests/xhtml/testfiles/resources/pdf/dummy.pdf"
-    response = requests.post(
+    response = session.post(
         "http://localhost:8000/api/download",
         json={"url": test_url}
     )
@@ -20,3 +23,5 @@ try:
     print(f"Response: {json.dumps(response.json(), indent=2)}")
 except Exception as e:
     print(f"Error adding download: {e}")
+finally:
+    session.close()